@@ -1,17 +1,39 @@
-import re
-from Server.flowchart_generator import flowchart_workflow
+from Server.flowchart_generator import process_query, diagram_type
 from flask import Flask, request, jsonify, render_template
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
 import logging
+import os
+import orjson
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson. orjson always emits compact output in insertion
+    order, so the provider's sort_keys/compact settings do not apply.
+    """
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
-logging.basicConfig(level=logging.DEBUG)
+app.debug = False
+app.config["PROPAGATE_EXCEPTIONS"] = False
+app.json = OrjsonProvider(app)
+# Reject oversized bodies before they are read or parsed.
+app.config["MAX_CONTENT_LENGTH"] = 64 * 1024
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+# Bounds LLM cost and the regex/JSON work done on whatever the model echoes back.
+MAX_QUERY_LENGTH = 2000
 
 def validate_mermaid(code):
-    return re.search(
-        r'^\s*(graph|classDiagram|sequenceDiagram|erDiagram|gantt|mindmap|stateDiagram-v2|timeline|gitGraph|C4Context|sankey|flowchart|pie|quadrantChart|requirementDiagram|journey|xyChart)', 
-        code, 
-        re.MULTILINE
-    )
+    """
+    Defense-in-depth check for entry points that do not go through process_query,
+    which already rejects code with an unsupported diagram type.
+    """
+    return diagram_type(code) is not None
 
 @app.route('/')
 def home():
@@ -27,23 +49,28 @@ def generate():
         user_input = data.get('query', '').strip()
         if not user_input:
             return jsonify({"error": "Empty query received"}), 400
+        if len(user_input) > MAX_QUERY_LENGTH:
+            return jsonify({"error": "Query too long"}), 413
 
-        result = flowchart_workflow.invoke({"input": user_input})
+        result = process_query({"input": user_input})
         
         if not isinstance(result, dict):
             return jsonify({"error": "Invalid response format"}), 500
             
         if 'error' in result:
             return jsonify(result), 400
-            
-        if not validate_mermaid(result.get('code', '')):
-            return jsonify({"error": "Invalid Mermaid syntax"}), 400
-                
+
         return jsonify(result)
 
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Request too large"}), 413
+
     except Exception as e:
         app.logger.error(f"Server error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+# Production: gunicorn -w 4 -k gthread --threads 8 Server.app:app
+# Each request holds a worker thread for the whole LLM call, so that serves at most
+# workers x threads (32) requests at once. The built-in server below is for local development only.
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run()
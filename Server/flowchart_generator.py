@@ -1,7 +1,13 @@
 import os
-import json
+import orjson
 import re
-import langgraph.graph as lg
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+from types import MappingProxyType
+from typing import Callable, Final
+from cachetools import TLRUCache
 from langchain.schema import SystemMessage, HumanMessage
 from langchain_groq import ChatGroq
 
@@ -11,28 +17,96 @@ try:
 except Exception:
     pass
 
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
 groq_api_key = os.getenv("GROQ_API_KEY")
 if not groq_api_key:
     raise ValueError("Missing GROQ_API_KEY environment variable")
 
+MODEL_NAME = os.getenv("MODEL_NAME", "llama-3.3-70b-versatile")
+
 llm = ChatGroq(
     temperature=0,
     groq_api_key=groq_api_key,
-    model_name=os.getenv("MODEL_NAME", "llama-3.3-70b-versatile")
+    model_name=MODEL_NAME
 )
 
+# Bump whenever the system prompt or post-processing changes so stale cached diagrams are not served.
+_PROMPT_VERSION = "1"
+
+# Processed results keyed by query: an in-process cache, backed by an on-disk cache
+# (when diskcache is installed) so entries survive restarts. Memory entries are
+# (snapshot, expires_at) pairs so an entry promoted from disk keeps the disk entry's
+# expiry instead of starting a fresh TTL.
+_CACHE_TTL = 24 * 60 * 60
+_LLM_CACHE = TLRUCache(maxsize=4096, ttu=lambda _key, entry, _now: entry[1], timer=time.time)
+_LLM_CACHE_LOCK = threading.Lock()
+# Resolved against the repository root, not the working directory, so every worker shares one cache.
+_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    os.getenv("LLM_CACHE_DIR", ".llm_cache")
+)
+_DISK_CACHE = diskcache.Cache(_CACHE_DIR) if diskcache else None
+
+# Identical queries arriving while a call is in flight share its result. Requests are served
+# on separate worker threads, so these are thread-safe concurrent futures.
+_INFLIGHT: dict[bytes, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# Keywords that open each supported Mermaid diagram type.
+_VALID_STARTS = frozenset({
+    "graph", "classDiagram", "sequenceDiagram", "erDiagram", "gantt", "mindmap",
+    "stateDiagram-v2", "timeline", "gitGraph", "C4Context", "sankey", "flowchart",
+    "pie", "quadrantChart", "requirementDiagram", "journey", "xyChart",
+})
+
+# Patterns are compiled once at import time instead of on every request.
+_SINGLE_QUOTE_KEY_RE = re.compile(r"'(?=\s*:)")
+
+_CLASS_MEMBERS_RE = re.compile(r'^(class\s+\w+)([+\-#].+)$', re.MULTILINE)
+_QUADRANT_RE = re.compile(r'(quadrant)\s+(\d+):')
+# "-->" is listed first so arrows are not split into "--" followed by ">".
+_SANKEY_ARROW_RE = re.compile(r'\s*(-->|--)\s*')
+# An indented step line with three or more colons; the greedy first group keeps the
+# extra colons in the step description and leaves the last two as separators.
+_JOURNEY_STEP_RE = re.compile(r'^(?=(?:[^:\n]*:){3})([^\S\n]+\S[^\n]*):([^:\n]*):([^:\n]*)$', re.MULTILINE)
+_AXIS_LABEL_RE = re.compile(r'(xAxis|yAxis)\s+label:')
+# An opening brace (absorbing an immediately following empty body) or a closing brace.
+_REQ_BRACE_RE = re.compile(r'(\{)\s*(\})?|\s*\}')
+
+def diagram_type(code: str) -> str | None:
+    """
+    Return the diagram keyword that opens the code, or None if it is not a supported type.
+    Trailing ":" or ";" (e.g. the older "gitGraph:" header) is ignored, and suffixed
+    variants such as "sankey-beta" resolve to their base keyword.
+    """
+    tokens = code.lstrip()[:32].split(None, 1)
+    if not tokens:
+        return None
+    head = tokens[0].rstrip(":;")
+    if head in _VALID_STARTS:
+        return head
+    base = head.rsplit("-", 1)[0]
+    return base if base in _VALID_STARTS else None
+
 def fix_class_diagram_syntax(code: str) -> str:
     """
     Detect class declarations with members appended without braces (e.g. "class BankAccount+accountNumber: string")
     and wrap the member definitions in curly braces with proper formatting.
     """
-    pattern = r'^(class\s+\w+)([+\-#].+)$'
+    # Only unindented lines starting with "class" can match, and the code itself opens with
+    # "classDiagram", so without a "\nclass" there is nothing to fix.
+    if "\nclass" not in code:
+        return code
     def repl(match):
         line = match.group(0)
         if "{" in line:
             return line
         return f"{match.group(1)} {{\n  {match.group(2)}\n}}"
-    fixed_code = re.sub(pattern, repl, code, flags=re.MULTILINE)
+    fixed_code = _CLASS_MEMBERS_RE.sub(repl, code)
     return fixed_code
 
 # Fix functions for specific diagram types.
@@ -41,159 +115,266 @@ def fix_quadrant_chart(code: str) -> str:
     Mermaid quadrant charts can be picky. Remove the space between 'quadrant' and the number.
     For example, change "quadrant 1:" to "quadrant1:".
     """
-    code = re.sub(r'(quadrant)\s+(\d+):', r'\1\2:', code)
+    code = _QUADRANT_RE.sub(r'\1\2:', code)
     return code
 
 def fix_sankey(code: str) -> str:
     """
     Ensure arrow syntax in sankey diagrams is consistently spaced.
     """
-    code = re.sub(r'\s*--\s*', ' -- ', code)
-    code = re.sub(r'\s*-->\s*', ' --> ', code)
-    return code
+    return _SANKEY_ARROW_RE.sub(lambda m: f" {m.group(1)} ", code)
 
 def fix_journey(code: str) -> str:
     """
     For journey diagrams, ensure that each step is formatted as "Step Text: number: Actor".
     If extra colons occur in the step description, rejoin them so that only two colons remain.
     """
-    fixed_lines = []
-    for line in code.splitlines():
-        # Only process lines that appear to be journey steps (indentation + text with colons)
-        if re.match(r'^\s+\S+', line) and line.count(":") > 2:
-            parts = line.split(":")
-            # Rejoin all parts except the last two for the step description.
-            step = ":".join(parts[:-2]).strip()
-            fixed_line = f"{step}: {parts[-2].strip()}: {parts[-1].strip()}"
-            fixed_lines.append(fixed_line)
-        else:
-            fixed_lines.append(line)
-    return "\n".join(fixed_lines)
+    # Normalize CRLF first so every line ends the same way whether or not it is rewritten.
+    code = code.replace("\r\n", "\n")
+    return _JOURNEY_STEP_RE.sub(lambda m: f"{m[1].strip()}: {m[2].strip()}: {m[3].strip()}", code)
 
 def fix_xy_chart(code: str) -> str:
     """
     Ensure axis label syntax is correct by removing extra spaces before the colon.
     """
-    code = re.sub(r'(xAxis|yAxis)\s+label:', r'\1 label:', code)
+    code = _AXIS_LABEL_RE.sub(r'\1 label:', code)
     return code
 
 def fix_requirement_diagram(code: str) -> str:
     """
     For requirement diagrams, force the opening brace to be on a new line with proper indentation.
     """
-    code = re.sub(r'\{\s*', '{\n  ', code)
-    code = re.sub(r'\s*\}', '\n}', code)
-    return code
+    def repl(match):
+        if not match.group(1):
+            return '\n}'
+        return '{\n}' if match.group(2) else '{\n  '
+    return _REQ_BRACE_RE.sub(repl, code)
+
+_PROCESSORS: dict[str, Callable[[str], str]] = {
+    "classDiagram": fix_class_diagram_syntax,
+    "quadrantChart": fix_quadrant_chart,
+    "sankey": fix_sankey,
+    "journey": fix_journey,
+    "xyChart": fix_xy_chart,
+    "requirementDiagram": fix_requirement_diagram,
+}
 
 def post_process_code(code: str) -> str:
     """
     Apply post-processing fixes based on the diagram type.
     """
-    if code.startswith("classDiagram"):
-        code = fix_class_diagram_syntax(code)
-    if code.startswith("quadrantChart"):
-        code = fix_quadrant_chart(code)
-    if code.startswith("sankey"):
-        code = fix_sankey(code)
-    if code.startswith("journey"):
-        code = fix_journey(code)
-    if code.startswith("xyChart"):
-        code = fix_xy_chart(code)
-    if code.startswith("requirementDiagram"):
-        code = fix_requirement_diagram(code)
-    return code
+    fn = _PROCESSORS.get(diagram_type(code))
+    return fn(code) if fn else code
 
-def process_query(state: dict) -> dict:
-    system_prompt = (
-        "{\"code\": \"mermaid_code\"}\n\nGenerate STRICT JSON with PROPER SYNTAX. The output must always follow this structure:\n\n"
-        "{\n  \"code\": \"mermaid_code\"\n}\n\nBelow are instructions and examples for various Mermaid diagram types. Use ONLY double quotes and escape newlines with \\n. Do NOT use markdown formatting.\n\n"
-        "1. If the User Provides Details (e.g., for a Class Diagram):\nExample Query:\n\"Create a detailed class diagram for a banking system with:\\n- Account base class with balance attribute\\n- SavingsAccount and CheckingAccount subclasses\\n- Transaction class with relationships\\n- Proper visibility modifiers and data types\"\n\n"
-        "Expected Output:\n{\"code\":\"classDiagram\\n    class Account {\\n        - balance: double\\n        + deposit(amount: double)\\n        + withdraw(amount: double)\\n    }\\n\\n    class SavingsAccount {\\n        - interestRate: double\\n        + calculateInterest(): double\\n    }\\n\\n    class CheckingAccount {\\n        - overdraftLimit: double\\n    }\\n\\n    class Transaction {\\n        - type: string\\n        - amount: double\\n        - date: Date\\n        + execute()\\n    }\\n\\n    Account <|-- SavingsAccount\\n    Account <|-- CheckingAccount\\n    Account *-- Transaction : hasTransactions\"}\n\n"
-        "2. If the User Provides No Specific Details (e.g., a simple Class Diagram):\nExample Query:\n\"Create a class diagram for a banking system\"\n\n"
-        "Expected Output:\n{\"code\":\"classDiagram\\n    class Bank {\\n        + name: string\\n        + location: string\\n    }\\n\\n    class Customer {\\n        + name: string\\n        + accountNumber: string\\n    }\\n\\n    class Account {\\n        + balance: double\\n        + deposit(amount: double)\\n        + withdraw(amount: double)\\n    }\\n\\n    Bank *-- Customer : has\\n    Customer *-- Account : owns\"}\n\n"
-        "3. Flowchart Diagrams:\nSimple Flowchart Example:\nExample Query:\n\"Create a flowchart for a banking process\"\n\n"
-        "Expected Output:\n{\"code\":\"graph TD\\n    Start --> Transaction[Perform Transaction]\\n    Transaction --> End\"}\n\n"
-        "Detailed Flowchart Example:\nExample Query:\n\"Create a detailed flowchart for a banking transaction\"\n\n"
-        "Expected Output:\n{\"code\":\"graph TD\\n    Start --> |Select Transaction| Decision{Deposit or Withdraw}\\n    Decision -->|Deposit| Process[Process Deposit]\\n    Decision -->|Withdraw| CheckBalance{Enough Balance?}\\n    CheckBalance -->|Yes| ProcessWithdraw[Process Withdrawal]\\n    CheckBalance -->|No| Reject[Reject Transaction]\\n    Process --> UpdateBalance[Update Balance]\\n    ProcessWithdraw --> UpdateBalance\\n    UpdateBalance --> End\\n    Reject --> End\"}\n\n"
-        "4. Sequence Diagrams:\nExample Query:\n\"Create a sequence diagram for a user login process\"\n\n"
-        "Expected Output:\n{\"code\":\"sequenceDiagram\\n    participant User\\n    participant System\\n    User->>System: Login Request\\n    System-->>User: Login Success\"}\n\n"
-        "5. ER Diagrams:\nExample Query:\n\"Create an ER diagram for an order management system\"\n\n"
-        "Expected Output:\n{\"code\":\"erDiagram\\n    CUSTOMER ||--o{ ORDER : places\\n    ORDER ||--|{ PRODUCT : contains\"}\n\n"
-        "6. Gantt Diagrams:\nExample Query:\n\"Create a Gantt diagram for a project timeline\"\n\n"
-        "Expected Output:\n{\"code\":\"gantt\\n    dateFormat  YYYY-MM-DD\\n    title Project Timeline\\n    section Planning\\n    Task A :a1, 2023-01-01, 10d\\n    section Development\\n    Task B :after a1, 20d\"}\n\n"
-        "7. Mindmap Diagrams:\nExample Query:\n\"Create a mindmap for brainstorming ideas\"\n\n"
-        "Expected Output:\n{\"code\":\"mindmap\\n  root((Central Idea))\\n    branch1((Sub Idea 1))\\n    branch2((Sub Idea 2))\"}\n\n"
-        "8. State Diagrams:\nExample Query:\n\"Create a state diagram for a ticket booking system\"\n\n"
-        "Expected Output:\n{\"code\":\"stateDiagram-v2\\n    [*] --> Idle\\n    Idle --> Booking\\n    Booking --> Confirmed\\n    Confirmed --> [*]\"}\n\n"
-        "9. Timeline Diagrams:\nExample Query:\n\"Create a timeline diagram for company milestones\"\n\n"
-        "Expected Output:\n{\"code\":\"timeline\\n    title Company Milestones\\n    2023-01-01 : Founded\\n    2023-06-01 : First Product Launch\"}\n\n"
-        "10. Git Diagrams:\nExample Query:\n\"Create a Git diagram for a feature branch workflow\"\n\n"
-        "Expected Output:\n{\"code\":\"gitGraph\\n    commit\\n    branch feature\\n    commit\\n    checkout feature\\n    commit\\n    merge feature\"}\n\n"
-        "11. C4 Diagrams:\nExample Query:\n\"Create a C4 context diagram for an e-commerce system\"\n\n"
-        "Expected Output:\n{\"code\":\"C4Context\\n    Person(customer, \\\"Customer\\\", \\\"A customer\\\")\\n    System(system, \\\"E-Commerce Platform\\\", \\\"Handles orders and payments\\\")\\n    Rel(customer, system, \\\"Uses\\\")\"}\n\n"
-        "12. Sankey Diagrams:\nExample Query:\n\"Create a Sankey diagram for energy flow\"\n\n"
-        "Expected Output:\n{\"code\":\"sankey\\n    A[Energy Source] -- 100 --> B[Conversion]\\n    B -- 60 --> C[Useful Energy]\\n    B -- 40 --> D[Losses]\"}\n\n"
-        "13. Block Diagrams:\nExample Query:\n\"Create a block diagram for a simple system architecture\"\n\n"
-        "Expected Output:\n{\"code\":\"flowchart LR\\n    A[Component A] --> B[Component B]\\n    B --> C[Component C]\"}\n\n"
-        "14. Pie Charts:\nExample Query:\n\"Create a pie chart for market share distribution\"\n\n"
-        "Expected Output:\n{\"code\":\"pie\\n    title Market Share\\n    \\\"Product A\\\" : 40\\n    \\\"Product B\\\" : 35\\n    \\\"Product C\\\" : 25\"}\n\n"
-        "15. Quadrant Diagrams:\nExpected Input: Provide a title and labels for each quadrant.\nExample Query:\n\"Create a quadrant diagram for project evaluation\"\n\n"
-        "Expected Output:\n{\"code\": \"quadrantChart\\n title Reach and engagement of campaigns\\n x-axis Low Reach --> High Reach\\n y-axis Low Engagement --> High Engagement\\n quadrant-1 We should expand\\n quadrant-2 Need to promote\\n quadrant-3 Re-evaluate\\n quadrant-4 May be improved\\n Campaign A: [0.3, 0.6]\\n Campaign B: [0.45, 0.23]\\n Campaign C: [0.57, 0.69]\\n Campaign D: [0.78, 0.34]\\n Campaign E: [0.40, 0.34]\\n Campaign F: [0.35, 0.78]\"}\n\n"
-        "16. Requirement Diagrams:\nExample Query:\n\"Create a requirement diagram for system specifications\"\n\n"
-        "Expected Output:\n{\"code\":\"requirementDiagram\\n    requirement req1 {\\n      id: 1\\n      text: \\\"System shall support user authentication\\\"\\n    }\"}\n\n"
-        "17. User Journey Diagrams:\nExample Query:\n\"Create a user journey diagram for onboarding new users\"\n\n"
-        "Expected Output:\n{\"code\":\"journey\\n    title User Onboarding\\n    section Registration\\n      Click Sign Up: 5: User\\n      Fill Form: 3: User\\n      Confirm Email: 2: System\"}\n\n"
-        "18. XY Diagrams:\nExample Query:\n\"Create an XY diagram for plotting data points\"\n\n"
-        "Expected Output:\n{\"code\":\"xyChart\\n    xAxis label: \\\"Time\\\"\\n    yAxis label: \\\"Value\\\"\\n    data: [ [0, 1], [1, 2], [2, 3] ]\"}\n\n"
-        "RULES:\n1. Use ONLY double quotes.\n2. Escape newlines with \\n.\n3. Never use markdown formatting.\n4. Always output STRICT JSON with proper syntax as shown in the examples."
-    )
+def _cache_key(user_input: str) -> bytes:
+    return hashlib.sha256(f"{MODEL_NAME}|{_PROMPT_VERSION}|{user_input}".encode()).digest()
+
+def _cache_get(key: bytes) -> dict | None:
+    """
+    Return a fresh copy of the cached, already post-processed result for key, if any.
+    """
+    with _LLM_CACHE_LOCK:
+        entry = _LLM_CACHE.get(key)
+    if entry is not None:
+        return dict(entry[0])
+    if _DISK_CACHE is None:
+        return None
+    data, expires_at = _DISK_CACHE.get(key, expire_time=True)
+    if data is None:
+        return None
+    with _LLM_CACHE_LOCK:
+        _LLM_CACHE[key] = (MappingProxyType(dict(data)), expires_at or time.time() + _CACHE_TTL)
+    return dict(data)
+
+def _cache_set(key: bytes, data: dict) -> None:
+    # Store a read-only snapshot so callers mutating their result cannot corrupt the cache.
+    with _LLM_CACHE_LOCK:
+        _LLM_CACHE[key] = (MappingProxyType(dict(data)), time.time() + _CACHE_TTL)
+    if _DISK_CACHE is not None:
+        _DISK_CACHE.set(key, dict(data), expire=_CACHE_TTL)
+
+_SYSTEM_PROMPT: Final[str] = (
+    "{\"code\": \"mermaid_code\"}\n\nGenerate STRICT JSON with PROPER SYNTAX. The output must always follow this structure:\n\n"
+    "{\n  \"code\": \"mermaid_code\"\n}\n\nBelow are instructions and examples for various Mermaid diagram types. Use ONLY double quotes and escape newlines with \\n. Do NOT use markdown formatting.\n\n"
+    "1. If the User Provides Details (e.g., for a Class Diagram):\nExample Query:\n\"Create a detailed class diagram for a banking system with:\\n- Account base class with balance attribute\\n- SavingsAccount and CheckingAccount subclasses\\n- Transaction class with relationships\\n- Proper visibility modifiers and data types\"\n\n"
+    "Expected Output:\n{\"code\":\"classDiagram\\n    class Account {\\n        - balance: double\\n        + deposit(amount: double)\\n        + withdraw(amount: double)\\n    }\\n\\n    class SavingsAccount {\\n        - interestRate: double\\n        + calculateInterest(): double\\n    }\\n\\n    class CheckingAccount {\\n        - overdraftLimit: double\\n    }\\n\\n    class Transaction {\\n        - type: string\\n        - amount: double\\n        - date: Date\\n        + execute()\\n    }\\n\\n    Account <|-- SavingsAccount\\n    Account <|-- CheckingAccount\\n    Account *-- Transaction : hasTransactions\"}\n\n"
+    "2. If the User Provides No Specific Details (e.g., a simple Class Diagram):\nExample Query:\n\"Create a class diagram for a banking system\"\n\n"
+    "Expected Output:\n{\"code\":\"classDiagram\\n    class Bank {\\n        + name: string\\n        + location: string\\n    }\\n\\n    class Customer {\\n        + name: string\\n        + accountNumber: string\\n    }\\n\\n    class Account {\\n        + balance: double\\n        + deposit(amount: double)\\n        + withdraw(amount: double)\\n    }\\n\\n    Bank *-- Customer : has\\n    Customer *-- Account : owns\"}\n\n"
+    "3. Flowchart Diagrams:\nSimple Flowchart Example:\nExample Query:\n\"Create a flowchart for a banking process\"\n\n"
+    "Expected Output:\n{\"code\":\"graph TD\\n    Start --> Transaction[Perform Transaction]\\n    Transaction --> End\"}\n\n"
+    "Detailed Flowchart Example:\nExample Query:\n\"Create a detailed flowchart for a banking transaction\"\n\n"
+    "Expected Output:\n{\"code\":\"graph TD\\n    Start --> |Select Transaction| Decision{Deposit or Withdraw}\\n    Decision -->|Deposit| Process[Process Deposit]\\n    Decision -->|Withdraw| CheckBalance{Enough Balance?}\\n    CheckBalance -->|Yes| ProcessWithdraw[Process Withdrawal]\\n    CheckBalance -->|No| Reject[Reject Transaction]\\n    Process --> UpdateBalance[Update Balance]\\n    ProcessWithdraw --> UpdateBalance\\n    UpdateBalance --> End\\n    Reject --> End\"}\n\n"
+    "4. Sequence Diagrams:\nExample Query:\n\"Create a sequence diagram for a user login process\"\n\n"
+    "Expected Output:\n{\"code\":\"sequenceDiagram\\n    participant User\\n    participant System\\n    User->>System: Login Request\\n    System-->>User: Login Success\"}\n\n"
+    "5. ER Diagrams:\nExample Query:\n\"Create an ER diagram for an order management system\"\n\n"
+    "Expected Output:\n{\"code\":\"erDiagram\\n    CUSTOMER ||--o{ ORDER : places\\n    ORDER ||--|{ PRODUCT : contains\"}\n\n"
+    "6. Gantt Diagrams:\nExample Query:\n\"Create a Gantt diagram for a project timeline\"\n\n"
+    "Expected Output:\n{\"code\":\"gantt\\n    dateFormat  YYYY-MM-DD\\n    title Project Timeline\\n    section Planning\\n    Task A :a1, 2023-01-01, 10d\\n    section Development\\n    Task B :after a1, 20d\"}\n\n"
+    "7. Mindmap Diagrams:\nExample Query:\n\"Create a mindmap for brainstorming ideas\"\n\n"
+    "Expected Output:\n{\"code\":\"mindmap\\n  root((Central Idea))\\n    branch1((Sub Idea 1))\\n    branch2((Sub Idea 2))\"}\n\n"
+    "8. State Diagrams:\nExample Query:\n\"Create a state diagram for a ticket booking system\"\n\n"
+    "Expected Output:\n{\"code\":\"stateDiagram-v2\\n    [*] --> Idle\\n    Idle --> Booking\\n    Booking --> Confirmed\\n    Confirmed --> [*]\"}\n\n"
+    "9. Timeline Diagrams:\nExample Query:\n\"Create a timeline diagram for company milestones\"\n\n"
+    "Expected Output:\n{\"code\":\"timeline\\n    title Company Milestones\\n    2023-01-01 : Founded\\n    2023-06-01 : First Product Launch\"}\n\n"
+    "10. Git Diagrams:\nExample Query:\n\"Create a Git diagram for a feature branch workflow\"\n\n"
+    "Expected Output:\n{\"code\":\"gitGraph\\n    commit\\n    branch feature\\n    commit\\n    checkout feature\\n    commit\\n    merge feature\"}\n\n"
+    "11. C4 Diagrams:\nExample Query:\n\"Create a C4 context diagram for an e-commerce system\"\n\n"
+    "Expected Output:\n{\"code\":\"C4Context\\n    Person(customer, \\\"Customer\\\", \\\"A customer\\\")\\n    System(system, \\\"E-Commerce Platform\\\", \\\"Handles orders and payments\\\")\\n    Rel(customer, system, \\\"Uses\\\")\"}\n\n"
+    "12. Sankey Diagrams:\nExample Query:\n\"Create a Sankey diagram for energy flow\"\n\n"
+    "Expected Output:\n{\"code\":\"sankey\\n    A[Energy Source] -- 100 --> B[Conversion]\\n    B -- 60 --> C[Useful Energy]\\n    B -- 40 --> D[Losses]\"}\n\n"
+    "13. Block Diagrams:\nExample Query:\n\"Create a block diagram for a simple system architecture\"\n\n"
+    "Expected Output:\n{\"code\":\"flowchart LR\\n    A[Component A] --> B[Component B]\\n    B --> C[Component C]\"}\n\n"
+    "14. Pie Charts:\nExample Query:\n\"Create a pie chart for market share distribution\"\n\n"
+    "Expected Output:\n{\"code\":\"pie\\n    title Market Share\\n    \\\"Product A\\\" : 40\\n    \\\"Product B\\\" : 35\\n    \\\"Product C\\\" : 25\"}\n\n"
+    "15. Quadrant Diagrams:\nExpected Input: Provide a title and labels for each quadrant.\nExample Query:\n\"Create a quadrant diagram for project evaluation\"\n\n"
+    "Expected Output:\n{\"code\": \"quadrantChart\\n title Reach and engagement of campaigns\\n x-axis Low Reach --> High Reach\\n y-axis Low Engagement --> High Engagement\\n quadrant-1 We should expand\\n quadrant-2 Need to promote\\n quadrant-3 Re-evaluate\\n quadrant-4 May be improved\\n Campaign A: [0.3, 0.6]\\n Campaign B: [0.45, 0.23]\\n Campaign C: [0.57, 0.69]\\n Campaign D: [0.78, 0.34]\\n Campaign E: [0.40, 0.34]\\n Campaign F: [0.35, 0.78]\"}\n\n"
+    "16. Requirement Diagrams:\nExample Query:\n\"Create a requirement diagram for system specifications\"\n\n"
+    "Expected Output:\n{\"code\":\"requirementDiagram\\n    requirement req1 {\\n      id: 1\\n      text: \\\"System shall support user authentication\\\"\\n    }\"}\n\n"
+    "17. User Journey Diagrams:\nExample Query:\n\"Create a user journey diagram for onboarding new users\"\n\n"
+    "Expected Output:\n{\"code\":\"journey\\n    title User Onboarding\\n    section Registration\\n      Click Sign Up: 5: User\\n      Fill Form: 3: User\\n      Confirm Email: 2: System\"}\n\n"
+    "18. XY Diagrams:\nExample Query:\n\"Create an XY diagram for plotting data points\"\n\n"
+    "Expected Output:\n{\"code\":\"xyChart\\n    xAxis label: \\\"Time\\\"\\n    yAxis label: \\\"Value\\\"\\n    data: [ [0, 1], [1, 2], [2, 3] ]\"}\n\n"
+    "RULES:\n1. Use ONLY double quotes.\n2. Escape newlines with \\n.\n3. Never use markdown formatting.\n4. Always output STRICT JSON with proper syntax as shown in the examples."
+)
+_SYSTEM_MSG = SystemMessage(content=_SYSTEM_PROMPT)
+
+def _join_inflight(key: bytes) -> tuple[Future, bool]:
+    """
+    Return the future for an in-flight call with this key and whether the caller owns it.
+    The owner must resolve the future and call _leave_inflight; everyone else waits on it.
+    """
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        if fut is not None:
+            return fut, False
+        fut = _INFLIGHT[key] = Future()
+        return fut, True
+
+def _leave_inflight(key: bytes) -> None:
+    with _INFLIGHT_LOCK:
+        _INFLIGHT.pop(key, None)
+
+def _build_messages(user_input: str) -> list:
+    return [_SYSTEM_MSG, HumanMessage(content=user_input)]
+
+class _JsonObjectScanner:
+    """
+    Track brace depth over streamed text, ignoring braces inside JSON strings,
+    to detect when the first top-level JSON object has been closed.
+    """
+    __slots__ = ("end", "_pos", "_depth", "_in_string", "_escaped")
+
+    def __init__(self):
+        self.end = -1
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, buf: str) -> bool:
+        """
+        Scan the text appended to buf since the last call. Returns True once the object is closed,
+        with self.end set to the index of its closing brace.
+        """
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                # Quotes in chatter before the object are not JSON strings.
+                self._in_string = self._depth > 0
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}' and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = i
+                    self._pos = i + 1
+                    return True
+        self._pos = len(buf)
+        return False
+
+def _stream_response(user_input: str) -> str:
+    """
+    Stream the LLM response and stop as soon as the JSON object is complete,
+    so trailing chatter is neither waited for nor generated.
+    """
+    scanner = _JsonObjectScanner()
+    buf = ""
+    stream = llm.stream(_build_messages(user_input))
+    try:
+        for chunk in stream:
+            buf += chunk.content
+            if scanner.feed(buf):
+                return buf[:scanner.end + 1]
+    finally:
+        stream.close()
+    return buf
 
+def _parse_response(raw: str) -> dict:
+    """
+    Extract, parse and post-process the diagram JSON from a raw LLM response.
+    """
+    raw = raw.strip()
+
+    # Extract the outermost JSON object; any markdown fences or chatter around it are dropped.
+    start = raw.find('{')
+    end = raw.rfind('}')
+    if start < 0 or end <= start:
+        return {"error": f"Could not find valid JSON in response:\n{raw}"}
+
+    # Replace single quotes around keys with double quotes (if any).
+    json_str = _SINGLE_QUOTE_KEY_RE.sub('"', raw[start:end + 1])
+
+    # Parse JSON.
+    try:
+        data = orjson.loads(json_str)
+    except orjson.JSONDecodeError as e:
+        return {"error": f"JSON Error: {str(e)}\nExtracted JSON: {json_str}"}
+
+    if 'code' not in data:
+        return {"error": "Invalid diagram syntax"}
+
+    # Post-process: Replace escaped newlines with actual newlines and fix known syntax issues.
+    data['code'] = data['code'].replace('\\n', '\n')
+    data['code'] = post_process_code(data['code'])
+    # Validate that we have valid starting syntax for supported diagram types.
+    if diagram_type(data['code']) is None:
+        return {"error": "Invalid diagram syntax"}
+    return data
+
+def process_query(state: dict) -> dict:
     try:
         user_input = state.get("input", "")
-        response = llm.invoke([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_input)
-        ])
-
-        # Get the raw response content.
-        raw = response.content.strip()
-
-        # Remove any markdown code fences if present.
-        cleaned = re.sub(r'^```(json)?|```$', '', raw, flags=re.MULTILINE | re.IGNORECASE)
-
-        # Replace single quotes around keys with double quotes (if any).
-        cleaned = re.sub(r"'(?=\s*:)", '"', cleaned)
-        
-        # Extract the first JSON object from the cleaned string.
-        json_match = re.search(r'({.*})', cleaned, re.DOTALL)
-        if not json_match:
-            return {"error": f"Could not find valid JSON in response:\n{cleaned}"}
-        json_str = json_match.group(1)
-
-        # Parse JSON.
+        key = _cache_key(user_input)
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+
+        fut, owner = _join_inflight(key)
+        if not owner:
+            return dict(fut.result())
+
         try:
-            data = json.loads(json_str)
-        except json.JSONDecodeError as e:
-            return {"error": f"JSON Error: {str(e)}\nExtracted JSON: {json_str}"}
-
-        # Post-process: Replace escaped newlines with actual newlines and fix known syntax issues.
-        if 'code' in data:
-            data['code'] = data['code'].replace('\\n', '\n')
-            data['code'] = post_process_code(data['code'])
-            # Validate that we have valid starting syntax for supported diagram types.
-            if not re.search(
-                r'^\s*(graph|classDiagram|sequenceDiagram|erDiagram|gantt|mindmap|stateDiagram-v2|timeline|gitGraph|C4Context|sankey|flowchart|pie|quadrantChart|requirementDiagram|journey|xyChart)', 
-                data['code']
-            ):
-                return {"error": "Invalid diagram syntax"}
-            
+            # A previous owner may have filled the cache between our miss and taking ownership.
+            data = _cache_get(key)
+            if data is None:
+                data = _parse_response(_stream_response(user_input))
+                # Only successfully processed results are cached; errors are retried on the next request.
+                if 'error' not in data:
+                    _cache_set(key, data)
+            fut.set_result(data)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            _leave_inflight(key)
         return data
 
     except Exception as e:
         return {"error": f"Processing Error: {str(e)}"}
-
-graph = lg.Graph()
-graph.add_node("process", process_query)
-graph.set_entry_point("process")
-graph.set_finish_point("process")
-flowchart_workflow = graph.compile()
\ No newline at end of file